@@ -1,16 +1,23 @@
+import numpy as np
 import pandas as pd
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError, NoCredentialsError
 import os
+import hashlib
+import re
 import logging
 import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from urllib.parse import urlparse
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from collections import deque
 from tqdm import tqdm
 from dotenv import load_dotenv
-from io import BytesIO
-from PIL import Image as PILImage
-from typing import cast # <-- Add this import
+from typing import Optional, cast # <-- Add this import
 
 # --- SCRIPT SETUP ---
 load_dotenv()
@@ -20,91 +27,355 @@ CSV_FILE_PATH = 'your_csv_file.csv'                    # Path to your CSV file c
 URL_COLUMN_NAME = 'URL'                                # Name of the column in your CSV that contains the image URLs
 DEST_S3_BUCKET = 'your-destination-bucket-name'        # Your AWS S3 bucket name where images will be uploaded
 DEST_S3_FOLDER = 'your-folder-name'                    # Folder/prefix within the S3 bucket where images will be stored
+DEST_KEY_HASH_PREFIX_LENGTH = 4                        # Hex characters of a per-row hash inserted after DEST_S3_FOLDER to spread writes across S3 partitions (0 to disable)
 
 MAX_WORKERS = 30                                       # Number of parallel workers (threads) for downloading/uploading. Adjust based on your system and network capacity.
+COPY_WORKERS = 10                                      # Number of parallel workers (threads) for server-side S3 copies of images whose URL appears on several rows.
 
-PROGRESS_FILE = 'processed_indices.log'                # File to track which CSV rows have been successfully processed
+MAX_IMAGE_BYTES = 64 * 1024 * 1024                     # Downloads larger than this are rejected and logged as failures.
+
+MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024                 # Images larger than this are streamed to S3 as a multipart upload in chunks of this size.
+MULTIPART_CONCURRENCY = 4                              # Number of parts uploaded in parallel for each multipart upload.
+S3_USE_ACCELERATE_ENDPOINT = False                     # Upload through S3 Transfer Acceleration (must be enabled on the bucket). Helps when the bucket is in a distant region.
+
+PROGRESS_FILE = 'processed_indices.bits'               # Bit-set file (one bit per CSV row) tracking which rows have been successfully processed
+LEGACY_PROGRESS_FILE = 'processed_indices.log'         # Older one-index-per-line progress log; imported into PROGRESS_FILE once if present
 ERROR_LOG_FILE = 'failed_urls.log'                     # File to log URLs that failed to process
+PROGRESS_FLUSH_INTERVAL = 64                           # Number of completed images between progress file flushes
 
 # --- SCRIPT ---
 
+SUBMIT_WINDOW = 2 * MAX_WORKERS                        # Maximum number of download tasks queued on the executor at once
+COPY_SUBMIT_WINDOW = 2 * COPY_WORKERS                  # Maximum number of copy tasks queued on the copy executor at once
+MIN_ADAPTIVE_WORKERS = 4                               # Concurrency never drops below this while backing off from throttling
+ADAPTIVE_BACKOFF_INTERVAL = 1                          # Seconds between successive halvings of concurrency, so one burst of errors halves it once
+ADAPTIVE_INCREASE_INTERVAL = 30                        # Seconds without throttling before concurrency grows by one
+
+# Each download worker can have up to MULTIPART_CONCURRENCY parts in flight, so size the S3 connection pool for all of them.
+S3_CLIENT_CONFIG = Config(max_pool_connections=MAX_WORKERS * MULTIPART_CONCURRENCY + COPY_WORKERS,
+                          tcp_keepalive=True,
+                          retries={'max_attempts': 10, 'mode': 'adaptive'},
+                          s3={'use_accelerate_endpoint': S3_USE_ACCELERATE_ENDPOINT})
+
+# Downloads are non-seekable streams, so s3transfer buffers each part in memory; capping the buffered
+# parts at MULTIPART_CONCURRENCY keeps each upload to roughly MULTIPART_CONCURRENCY * MULTIPART_CHUNK_SIZE.
+TRANSFER_CONFIG = TransferConfig(multipart_threshold=MULTIPART_CHUNK_SIZE,
+                                 multipart_chunksize=MULTIPART_CHUNK_SIZE,
+                                 max_concurrency=MULTIPART_CONCURRENCY,
+                                 use_threads=True)
+TRANSFER_CONFIG.max_in_memory_upload_chunks = MULTIPART_CONCURRENCY
+
+# Captures the last path segment of a URL without its final extension, i.e. the same
+# result as os.path.splitext(os.path.basename(urlparse(url).path))[0], in one pass.
+# Leading whitespace is skipped as urlparse and requests do, and leading dots belong to
+# the name, as with splitext ('.jpg' stays '.jpg', '..' stays '..'). The host and the
+# directories cannot overlap, so the match stays linear in the URL length.
+_NAME_RE = re.compile(r'^\s*[A-Za-z][A-Za-z0-9+.-]*://[^/?#]*/(?:[^?#]*/)?(\.*[^/?#;]*?)(?:\.[^./?#;]*)?(?:[?#;]|$)')
+
+# Matches the last segment of a key written by build_dest_key: '<row index>_<file name>', with no zero-padding.
+_UPLOADED_KEY_RE = re.compile(r'^(0|[1-9][0-9]*)_(.+)$')
+
+FORMAT_PEEK_BYTES = 16                                 # Leading bytes buffered from each download to detect the image format.
+
+class PrefixedStream:
+    """Read-only file object that replays already-consumed leading bytes before the rest of a stream."""
+
+    def __init__(self, prefix, stream):
+        self._prefix = prefix
+        self._stream = stream
+
+    def read(self, size=-1):
+        prefix, self._prefix = self._prefix, b''
+        if size is None or size < 0:
+            return prefix + self._stream.read()
+        if len(prefix) >= size:
+            self._prefix = prefix[size:]
+            return prefix[:size]
+        return prefix + self._stream.read(size - len(prefix))
+
+class SizeLimitedStream:
+    """Read-only file object that raises ValueError once more than `limit` bytes have been read from a stream."""
+
+    def __init__(self, stream, limit):
+        self._stream = stream
+        self._limit = limit
+        self._remaining = limit
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining + 1
+        data = self._stream.read(size)
+        self._remaining -= len(data)
+        if self._remaining < 0:
+            raise ValueError(f"Image is too large (over the {self._limit} byte limit).")
+        return data
+
+HEIF_BRANDS = {b'heic', b'heix', b'hevc', b'hevx', b'mif1', b'msf1'}
+
+def sniff_format(b: bytes) -> Optional[str]:
+    """Returns the file extension for an image based on its leading magic bytes, or None if unrecognised."""
+    if b.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if b.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if b.startswith(b'GIF87a') or b.startswith(b'GIF89a'):
+        return 'gif'
+    if b.startswith(b'RIFF') and b[8:12] == b'WEBP':
+        return 'webp'
+    if b.startswith(b'BM'):
+        return 'bmp'
+    if b.startswith(b'II*\x00') or b.startswith(b'MM\x00*'):
+        return 'tiff'
+    if b[4:8] == b'ftyp':
+        if b[8:12] in HEIF_BRANDS:
+            return 'heic'
+        if b[8:12] in (b'avif', b'avis'):
+            return 'avif'
+    return None
+
+# A single boto3 Session per process, so credentials and region are resolved only once.
+BOTO3_SESSION = boto3.session.Session()
+S3_CLIENT = None
+
+def get_s3_client():
+    """
+    Returns the S3 client shared by every worker thread, creating it on first use.
+    boto3 low-level clients are thread-safe; do not recreate one per thread or per task,
+    since building a client loads the service model and opens a new connection pool.
+    """
+    global S3_CLIENT
+    if S3_CLIENT is None:
+        S3_CLIENT = BOTO3_SESSION.client('s3', config=S3_CLIENT_CONFIG)
+    return S3_CLIENT
+
+def is_throttling_error(exc):
+    """Returns True if an exception means the source server or S3 is overloaded (HTTP 429/5xx or S3 SlowDown)."""
+    if isinstance(exc, requests.exceptions.RetryError):
+        return True
+    if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    if isinstance(exc, ClientError):
+        status_code = exc.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        return exc.response.get('Error', {}).get('Code') == 'SlowDown' or status_code == 429 or status_code >= 500
+    return False
+
+class AdaptiveLimiter:
+    """
+    Context manager that bounds how many tasks do network work at once, using
+    additive-increase/multiplicative-decrease: the limit halves when a task fails
+    with a throttling error and grows by one after each increase interval with no throttling errors.
+    """
+
+    def __init__(self, max_permits, min_permits):
+        self._max_permits = max_permits
+        self._min_permits = min(min_permits, max_permits)
+        self._permits = max_permits
+        self._in_use = 0
+        self._last_change = time.monotonic()
+        self._last_throttle = self._last_change
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        with self._condition:
+            while self._in_use >= self._permits:
+                self._condition.wait()
+            self._in_use += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        with self._condition:
+            self._in_use -= 1
+            now = time.monotonic()
+            if exc is not None and is_throttling_error(exc):
+                self._last_throttle = now
+                if self._permits > self._min_permits and now - self._last_change >= ADAPTIVE_BACKOFF_INTERVAL:
+                    self._permits = max(self._min_permits, self._permits // 2)
+                    self._last_change = now
+                    _LOG.warning(f"Source or S3 is throttling; reducing concurrency to {self._permits}.")
+            elif (self._permits < self._max_permits
+                  and now - self._last_throttle >= ADAPTIVE_INCREASE_INTERVAL
+                  and now - self._last_change >= ADAPTIVE_INCREASE_INTERVAL):
+                self._permits += 1
+                self._last_change = now
+            self._condition.notify_all()
+        return False
+
+CONCURRENCY_LIMITER = AdaptiveLimiter(MAX_WORKERS, MIN_ADAPTIVE_WORKERS)
+COPY_LIMITER = AdaptiveLimiter(COPY_WORKERS, MIN_ADAPTIVE_WORKERS)
+
+_tls = threading.local()
+
+def get_session():
+    """Returns this thread's pooled requests.Session, creating it on first use."""
+    session = getattr(_tls, 'session', None)
+    if session is None:
+        session = requests.Session()
+        session.headers.update({'Accept-Encoding': 'gzip', 'Connection': 'keep-alive', 'User-Agent': 's3-importer/1.0'})
+        retry = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504], allowed_methods={'GET'})
+        adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS, max_retries=retry)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _tls.session = session
+    return session
+
+# Looked up once here rather than per task, since getLogger takes the logging module lock.
+ERROR_LOGGER = logging.getLogger('error_logger')
+_LOG = logging.getLogger()
+
 def setup_logging():
     """Sets up two loggers: one for errors and one for general info."""
-    error_logger = logging.getLogger('error_logger')
-    if not error_logger.handlers:
-        error_logger.setLevel(logging.ERROR)
+    if not ERROR_LOGGER.handlers:
+        ERROR_LOGGER.setLevel(logging.ERROR)
         error_handler = logging.FileHandler(ERROR_LOG_FILE)
         error_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
-        error_logger.addHandler(error_handler)
+        ERROR_LOGGER.addHandler(error_handler)
 
     logging.basicConfig(level=logging.INFO,
                         format='%(asctime)s - %(levelname)s - %(message)s',
                         force=True)
 
-def load_processed_indices():
-    """Loads the set of already processed CSV row indices from the progress file."""
-    if not os.path.exists(PROGRESS_FILE):
-        return set()
-    with open(PROGRESS_FILE, 'r') as f:
-        return {int(line.strip()) for line in f if line.strip()}
+def open_progress_bits(num_rows):
+    """
+    Opens the progress bit-set as a writable memory map with one bit per CSV row,
+    creating or growing the file as needed and importing any legacy text log.
+    """
+    num_bytes = max(1, (num_rows + 7) // 8)
+    with open(PROGRESS_FILE, 'ab') as f:
+        if f.tell() < num_bytes:
+            f.truncate(num_bytes)
+    progress_bits = np.memmap(PROGRESS_FILE, dtype=np.uint8, mode='r+', shape=(num_bytes,))
 
-def log_processed_index(index):
-    """Appends a successfully processed index to the progress file."""
-    with open(PROGRESS_FILE, 'a') as f:
-        f.write(f"{index}\n")
+    if os.path.exists(LEGACY_PROGRESS_FILE):
+        with open(LEGACY_PROGRESS_FILE, 'r') as f:
+            for line in f:
+                if line.strip() and int(line) < num_rows:
+                    mark_processed(progress_bits, int(line))
+        progress_bits.flush()
+        os.replace(LEGACY_PROGRESS_FILE, LEGACY_PROGRESS_FILE + '.imported')
+        _LOG.info(f"Imported {LEGACY_PROGRESS_FILE} into {PROGRESS_FILE}.")
+
+    return progress_bits
+
+def mark_processed(progress_bits, index):
+    """Sets the bit for a successfully processed CSV row index."""
+    progress_bits[index >> 3] |= 0x80 >> (index & 7)
+
+def list_uploaded_keys(s3_client, num_rows, wanted_mask, progress_bits=None):
+    """
+    Lists every image already under DEST_S3_FOLDER, using one ListObjectsV2 request
+    per 1000 keys, and returns (number of images found, dict mapping row index to S3 key).
+    Only rows selected by the boolean wanted_mask are kept in the dict; if progress_bits
+    is given, every row found is also marked as processed. Keys whose name is not
+    '<row index>_<file name>' (as written by build_dest_key) are skipped.
+    """
+    found = 0
+    uploaded_keys = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=DEST_S3_BUCKET, Prefix=f"{DEST_S3_FOLDER}/"):
+        for obj in page.get('Contents', []):
+            key_match = _UPLOADED_KEY_RE.match(obj['Key'].rsplit('/', 1)[-1])
+            if not key_match or int(key_match.group(1)) >= num_rows:
+                continue
+            index = int(key_match.group(1))
+            found += 1
+            if progress_bits is not None:
+                mark_processed(progress_bits, index)
+            if wanted_mask[index]:
+                uploaded_keys[index] = obj['Key']
+    return found, uploaded_keys
+
+def iter_tasks(tasks_to_process):
+    """Yields (url, indices) for each unique URL, with the CSV row indices that reference it."""
+    row_indices = tasks_to_process.index.to_numpy()
+    for url, positions in tasks_to_process.groupby(URL_COLUMN_NAME, sort=False).indices.items():
+        yield url, [int(index) for index in row_indices[positions]]
+
+def filename_from_key(key):
+    """Returns the file name part of a key built by build_dest_key, without the row index prefix."""
+    return key.rsplit('/', 1)[-1].split('_', 1)[1]
+
+def build_dest_key(original_index, filename):
+    """Returns the S3 key that the image for a CSV row is stored under."""
+    if DEST_KEY_HASH_PREFIX_LENGTH:
+        key_hash = hashlib.md5(str(original_index).encode()).hexdigest()[:DEST_KEY_HASH_PREFIX_LENGTH]
+        return f"{DEST_S3_FOLDER}/{key_hash}/{original_index}_{filename}"
+    return f"{DEST_S3_FOLDER}/{original_index}_{filename}"
 
 def process_image_download_upload(s3_client, source_url, original_index):
     """
     Downloads an image, validates it, determines its true file type,
     and uploads it to our S3 bucket with the correct file extension.
+    Returns the uploaded file name (without the index prefix).
     """
-    error_logger = logging.getLogger('error_logger')
-    
     try:
-        response = requests.get(source_url, timeout=30)
-        response.raise_for_status()
-        image_data = response.content
+        with CONCURRENCY_LIMITER, get_session().get(source_url, timeout=(5, 30), stream=True) as response:
+            response.raise_for_status()
+            content_length = int(response.headers.get('Content-Length', 0))
+            if content_length > MAX_IMAGE_BYTES:
+                raise ValueError(f"Image is too large ({content_length} bytes, limit is {MAX_IMAGE_BYTES}).")
+            response.raw.decode_content = True
+            header = response.raw.read(FORMAT_PEEK_BYTES)
 
-        try:
-            image = PILImage.open(BytesIO(image_data))
-            if not image.format:
-                raise ValueError("Could not determine image format from the provided data.")
-            image_format = image.format.lower()
-        except Exception as e:
-            raise ValueError(f"Invalid or unsupported image format. Pillow error: {e}")
-
-        extension_map = {'jpeg': 'jpg'}
-        extension = extension_map.get(image_format, image_format)
-
-        base_filename = os.path.splitext(os.path.basename(urlparse(source_url).path))[0]
-        if not base_filename:
-             base_filename = f"image"
-
-        new_filename = f"{base_filename}.{extension}"
-        dest_key = f"{DEST_S3_FOLDER}/{original_index}_{new_filename}"
-
-        s3_client.put_object(
-            Bucket=DEST_S3_BUCKET,
-            Key=dest_key,
-            Body=image_data,
-            ContentType=response.headers.get('Content-Type', f'image/{extension}')
-        )
-        return original_index
+            extension = sniff_format(header)
+            if extension is None:
+                raise ValueError("Invalid or unsupported image format.")
+
+            name_match = _NAME_RE.match(source_url)
+            base_filename = name_match.group(1) if name_match else ''
+            if not base_filename:
+                 base_filename = f"image"
+
+            new_filename = f"{base_filename}.{extension}"
+            dest_key = build_dest_key(original_index, new_filename)
+
+            s3_client.upload_fileobj(
+                SizeLimitedStream(PrefixedStream(header, response.raw), MAX_IMAGE_BYTES),
+                DEST_S3_BUCKET,
+                dest_key,
+                ExtraArgs={'ContentType': response.headers.get('Content-Type', f'image/{extension}')},
+                Config=TRANSFER_CONFIG
+            )
+        return new_filename
 
     except requests.exceptions.RequestException as e:
         error_message = f"RequestException downloading {source_url}: {e}"
-        logging.warning(error_message)
-        error_logger.error(f"{source_url} - {error_message}")
+        _LOG.warning(error_message)
+        ERROR_LOGGER.error(f"{source_url} - {error_message}")
         raise e
     except (ClientError, ValueError) as e:
         error_message = f"Data or ClientError for {source_url}: {e}"
-        logging.warning(error_message)
-        error_logger.error(f"{source_url} - {error_message}")
+        _LOG.warning(error_message)
+        ERROR_LOGGER.error(f"{source_url} - {error_message}")
         raise e
     except Exception as e:
         error_message = f"An unexpected error occurred for URL {source_url}: {e}"
-        logging.warning(error_message)
-        error_logger.error(f"{source_url} - {error_message}")
+        _LOG.warning(error_message)
+        ERROR_LOGGER.error(f"{source_url} - {error_message}")
+        raise e
+
+def copy_uploaded_image(s3_client, source_url, source_key, original_index, new_filename):
+    """
+    Copies an image that was already uploaded for another row with the same URL
+    to this row's key, using a server-side S3 copy instead of downloading it again.
+    """
+    try:
+        with COPY_LIMITER:
+            s3_client.copy_object(
+                Bucket=DEST_S3_BUCKET,
+                Key=build_dest_key(original_index, new_filename),
+                CopySource={'Bucket': DEST_S3_BUCKET, 'Key': source_key}
+            )
+        return new_filename
+
+    except ClientError as e:
+        error_message = f"ClientError copying {source_key} for {source_url}: {e}"
+        _LOG.warning(error_message)
+        ERROR_LOGGER.error(f"{source_url} - {error_message}")
+        raise e
+    except Exception as e:
+        error_message = f"An unexpected error occurred copying {source_key} for URL {source_url}: {e}"
+        _LOG.warning(error_message)
+        ERROR_LOGGER.error(f"{source_url} - {error_message}")
         raise e
 
 def main():
@@ -112,58 +383,148 @@ def main():
     setup_logging()
     
     try:
-        s3_client = boto3.client('s3')
+        s3_client = get_s3_client()
     except NoCredentialsError:
-        logging.error("Failed to create Boto3 client. Check credentials in .env file.")
+        _LOG.error("Failed to create Boto3 client. Check credentials in .env file.")
         return
 
     try:
-        df = pd.read_csv(CSV_FILE_PATH)
-        if URL_COLUMN_NAME not in df.columns:
-            logging.error(f"Column '{URL_COLUMN_NAME}' not found in {CSV_FILE_PATH}.")
+        if URL_COLUMN_NAME not in pd.read_csv(CSV_FILE_PATH, nrows=0).columns:
+            _LOG.error(f"Column '{URL_COLUMN_NAME}' not found in {CSV_FILE_PATH}.")
             return
+        # Only the URL column is loaded; the default RangeIndex keeps row indices aligned with the progress file.
+        df = pd.read_csv(CSV_FILE_PATH, usecols=[URL_COLUMN_NAME], engine='pyarrow', dtype_backend='pyarrow')
     except FileNotFoundError:
-        logging.error(f"CSV file not found at: {CSV_FILE_PATH}")
+        _LOG.error(f"CSV file not found at: {CSV_FILE_PATH}")
         return
 
-    processed_indices = load_processed_indices()
-    logging.info(f"Found {len(processed_indices)} already processed images. Resuming...")
+    progress_bits = open_progress_bits(len(df))
+    processed_mask = np.unpackbits(progress_bits, count=len(df)).astype(bool)
+    # Rows whose URL appears on more than one row; only their existing S3 keys are worth keeping for reuse.
+    repeated_url_mask = df[URL_COLUMN_NAME].duplicated(keep=False).to_numpy(dtype=bool)
+    keys_by_index = None
+    if not processed_mask.any():
+        # No local progress (first run, or the progress file was lost): rebuild it from what is already in S3.
+        try:
+            recovered, keys_by_index = list_uploaded_keys(s3_client, len(df), repeated_url_mask, progress_bits)
+            if recovered:
+                progress_bits.flush()
+                _LOG.info(f"Recovered {recovered} already uploaded images from s3://{DEST_S3_BUCKET}/{DEST_S3_FOLDER}/.")
+                processed_mask = np.unpackbits(progress_bits, count=len(df)).astype(bool)
+        except ClientError as e:
+            _LOG.warning(f"Could not list existing images in S3 to recover progress: {e}")
+    _LOG.info(f"Found {int(processed_mask.sum())} already processed images. Resuming...")
     
     # --- FIX IS HERE ---
     # We apply the 'cast' right after the first filtering operation.
     # This tells the type checker that 'unprocessed_df' is still a DataFrame.
     unprocessed_df = cast(
         pd.DataFrame,
-        df[~df.index.isin(processed_indices)]
+        df[~processed_mask]
     )
     
     # Now that pyright knows 'unprocessed_df' is a DataFrame, this next line will work correctly.
-    tasks_to_process = unprocessed_df[unprocessed_df[URL_COLUMN_NAME].notna()]
+    tasks_to_process = unprocessed_df.dropna(subset=[URL_COLUMN_NAME])
     # --- END FIX ---
     
     if tasks_to_process.empty:
-        logging.info("All images have already been processed or no new URLs found. Nothing to do.")
+        _LOG.info("All images have already been processed or no new URLs found. Nothing to do.")
         return
         
-    logging.info(f"Starting to download and upload {len(tasks_to_process)} new images...")
+    _LOG.info(f"Starting to download and upload {len(tasks_to_process)} new images "
+              f"({tasks_to_process[URL_COLUMN_NAME].nunique()} unique URLs)...")
+
+    # URLs that were already uploaded for an earlier row (e.g. in a previous run) are copied
+    # server-side from that object instead of being downloaded again.
+    processed_df = df[processed_mask]
+    repeated_df = processed_df[processed_df[URL_COLUMN_NAME].isin(tasks_to_process[URL_COLUMN_NAME])]
+    uploaded_keys = {}
+    if not repeated_df.empty:
+        if keys_by_index is None:
+            wanted_mask = np.zeros(len(df), dtype=bool)
+            wanted_mask[repeated_df.index.to_numpy()] = True
+            try:
+                _, keys_by_index = list_uploaded_keys(s3_client, len(df), wanted_mask)
+            except ClientError as e:
+                _LOG.warning(f"Could not list existing images in S3 to reuse them for repeated URLs: {e}")
+                keys_by_index = {}
+        for index, url in zip(repeated_df.index.to_numpy(), repeated_df[URL_COLUMN_NAME].to_numpy(dtype=object)):
+            if int(index) in keys_by_index:
+                uploaded_keys.setdefault(url, keys_by_index[int(index)])
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_index = {
-            executor.submit(process_image_download_upload, s3_client, row[URL_COLUMN_NAME], index): index
-            for index, row in tasks_to_process.iterrows()
-        }
+    # URLs already in S3 only produce copies, so they are fed from their own stream and bounded by the
+    # copy window without holding up the URLs that still have to be downloaded.
+    reused_mask = tasks_to_process[URL_COLUMN_NAME].isin(uploaded_keys.keys())
+    pending_urls = iter_tasks(tasks_to_process[~reused_mask])
+    pending_reused_urls = iter_tasks(tasks_to_process[reused_mask])
+    pending_copies = deque()
+    reused_copies = deque()
 
-        progress_bar = tqdm(as_completed(future_to_index), total=len(tasks_to_process), desc="Downloading/Uploading Images")
+    # Downloads (streamed straight into S3) and server-side copies of duplicate URLs run on separate pools,
+    # so a backlog of cheap copies never holds up downloads and each side can be sized independently.
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as download_executor, \
+         ThreadPoolExecutor(max_workers=COPY_WORKERS) as copy_executor:
+        # Each future maps to (url, row index, duplicate row indices still to be copied from it).
+        download_futures = {}
+        copy_futures = {}
+
+        def fill_windows():
+            """Tops each pool up to its submission window from the remaining unique URLs and the queued copies."""
+            while len(download_futures) < SUBMIT_WINDOW:
+                task = next(pending_urls, None)
+                if task is None:
+                    break
+                url, indices = task
+                future = download_executor.submit(process_image_download_upload, s3_client, url, indices[0])
+                download_futures[future] = (url, indices[0], indices[1:])
+            while len(reused_copies) < COPY_SUBMIT_WINDOW:
+                task = next(pending_reused_urls, None)
+                if task is None:
+                    break
+                url, indices = task
+                reused_copies.extend((url, uploaded_keys[url], index) for index in indices)
+            while (pending_copies or reused_copies) and len(copy_futures) < COPY_SUBMIT_WINDOW:
+                source_url, source_key, index = (pending_copies or reused_copies).popleft()
+                future = copy_executor.submit(copy_uploaded_image, s3_client, source_url, source_key, index,
+                                              filename_from_key(source_key))
+                copy_futures[future] = (source_url, index, [])
+
+        # Only a window of tasks is queued on each pool at a time; new ones are submitted as others finish.
+        fill_windows()
+
+        progress_bar = tqdm(total=len(tasks_to_process), desc="Downloading/Uploading Images")
         
-        for future in progress_bar:
-            original_index = future_to_index[future]
-            try:
-                result_index = future.result()
-                log_processed_index(result_index)
-            except Exception:
-                logging.warning(f"Failed to process row index {original_index}. See {ERROR_LOG_FILE} for details.")
+        completed_since_flush = 0
+        try:
+            while download_futures or copy_futures:
+                done, _ = wait([*download_futures, *copy_futures], return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = download_futures.pop(future, None) or copy_futures.pop(future)
+                    source_url, original_index, duplicate_indices = task
+                    try:
+                        new_filename = future.result()
+                    except Exception:
+                        for index in [original_index, *duplicate_indices]:
+                            _LOG.warning(f"Failed to process row index {index}. See {ERROR_LOG_FILE} for details.")
+                        progress_bar.update(1 + len(duplicate_indices))
+                        continue
+
+                    mark_processed(progress_bits, original_index)
+                    completed_since_flush += 1
+                    if completed_since_flush >= PROGRESS_FLUSH_INTERVAL:
+                        progress_bits.flush()
+                        completed_since_flush = 0
+                    progress_bar.update(1)
+
+                    source_key = build_dest_key(original_index, new_filename)
+                    pending_copies.extend((source_url, source_key, index) for index in duplicate_indices)
+
+                fill_windows()
+        finally:
+            progress_bar.close()
+            progress_bits.flush()
 
-    logging.info("Script finished.")
+    _LOG.info("Script finished.")
 
 
 if __name__ == "__main__":